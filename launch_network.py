@@ -1,4 +1,3 @@
-import time
 import argparse
 
 from src.daemon import Daemon
@@ -11,13 +10,14 @@ def main(n_peers):
     # Initial peer on network
     peer = Daemon("node0", ("localhost", 5000), None)
     peer.start()
+    peer.ready()
     peers.append(peer)
-    
+
     for i in range(n_peers - 1):
-        time.sleep(10)
         # Create other peers that connect to initial peer
         peer = Daemon("node" + str(i + 1), ("localhost", 5001 + i), ("localhost", 5000))
         peer.start()
+        peer.ready()  # Wait until the peer is configured before launching the next
         peers.append(peer)
         
     # Wait for peers to finish
@@ -28,7 +28,7 @@ class Client:
         PeerProto.send_msg(self._sock, request_image_msg)
         # Receive image from daemon
         image_msg = PeerProto.recv_msg(self._sock)  # Blocks client
-        return image_msg.image
+        return image_msg.image  # Decoded lazily from the received bytes
 
     def run(self):
         """Run until done."""
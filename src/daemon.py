@@ -1,38 +1,64 @@
 """Daemon implementation."""
-import imagehash
+import cv2
+import numpy as np
 import os
 import selectors
 import socket
+import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 
 from .peer_protocol import PeerProto
 
 
+
 class Daemon(Thread):
     def __init__(self, folder_path, addr, join_addr=None):
         Thread.__init__(self)
 
-        self._send_mutex = Lock() # Only one thread must send data at a time
         self._folder_mutex = Lock() # Only one thread must access the folder at a time
+        self._send_locks = {}  # { conn: Lock } - Only one thread must send data on a connection at a time
+        self._workers = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)  # Handles received messages
 
         self._addr = addr
         self._done = False
+        self._ready = Event()  # Set once self is configured on the network
         self._folder_path = folder_path
         self._image = {}  # { hash: path } - Indexes all images in folder
+        self._bytes_cache = {}  # { hash: bytes } - Raw encoded bytes of recently sent images
         self._net_info = {}  # { id: { addr: (host, port), hash: {h1,..,hN}, size: value } }
-        self._send_conn = {}  # { id: conn } - Connections that self uses to send data
-        self._recv_conn = {}  # { id: conn } - Connections that self uses to receive data
+        self._conn = {}  # { id: conn } - Single full-duplex connection with each peer
+        self._rxbuf = {}  # { conn: bytearray } - Receive buffer of each connection
+
+        self._all_hashes = set()  # { h1,..,hN } - Union of all hashes in _net_info
+        self._hash_to_id = {}  # { hash: id } - Reverse index of _net_info hashes
+        self._conn_to_id = {}  # { conn: id } - Reverse index of _conn
+        self._addr_to_id = {}  # { (host, port): id } - Reverse index of _net_info addrs
 
         self._own_request = set()  # { h1,..,hN }
         self._client_request = {}  # { conn: hash }
+        self._client_request_by_hash = {}  # { hash: [conn,..] } - Reverse index of _client_request
+
+        self._handlers = {  # { command: handler } - Dispatch table of action()
+            "join": self.joinHandler,
+            "config": self.configHandler,
+            "update": self.updateHandler,
+            "request_image": self.requestImageHandler,
+            "image": self.imageHandler,
+            "request_list": self.requestListHandler,
+        }
 
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # Listener socket
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Reuse socket
         self._sock.bind(self._addr)
 
-        self._sel = selectors.DefaultSelector()  # Selector
+        # Prefer epoll: O(ready) dispatch and no 1024-fd limit of select()
+        if hasattr(selectors, "EpollSelector"):
+            self._sel = selectors.EpollSelector()
+        else:
+            self._sel = selectors.DefaultSelector()  # Selector
         self._sel.register(self._sock, selectors.EVENT_READ, self.accept)  # Wait for connections
 
         self._sock.listen(20)  # Number of concurrent peers
@@ -42,9 +68,13 @@ class Daemon(Thread):
             self._id = 1
             self.setAddr(self._id, self._addr)
             self.parseFolder()
+            self._ready.set()  # Listening and configured, peers can join
         else:
             self._join_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self._join_sock.connect(join_addr)
+            # Config and every later message from that peer arrive on this same connection
+            self._rxbuf[self._join_sock] = bytearray()
+            self._sel.register(self._join_sock, selectors.EVENT_READ, self.read)
 
             join_msg = PeerProto.join(self._addr)
             PeerProto.send_msg(self._join_sock, join_msg)
@@ -52,241 +82,306 @@ class Daemon(Thread):
     def accept(self, sock: socket.socket):
         """Accept a connection."""
         conn, addr = sock.accept()
-        conn.setblocking(True)
+        conn.setblocking(True)  # Sends are blocking, reads use MSG_DONTWAIT
+        self._rxbuf[conn] = bytearray()  # Receive buffer of connection
         self._sel.register(conn, selectors.EVENT_READ, self.read)  # Reads data from connection
 
     def read(self, conn: socket.socket):
         """Reads data from connection."""
-        msg = PeerProto.recv_msg(conn)
+        buf = self._rxbuf.setdefault(conn, bytearray())
+
+        # Drain the socket without blocking the selector loop
+        closed = False
+        while True:
+            try:
+                data = conn.recv(65536, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break  # No more data for now
+            except ConnectionError:
+                data = b""
+            if not data:  # Connection was closed
+                closed = True
+                break
+            buf.extend(data)
+
+        # Parse as many whole framed messages as the buffer contains
+        while True:
+            msg, consumed = PeerProto.try_parse(buf)
+            if msg == None:
+                break
+            del buf[:consumed]
+
+            # Index received connection by id
+            if msg.command != "join" and msg.from_id != 0:
+                self.setConn(msg.from_id, conn)
+
+            print("[DEBUG PORT=" + str(self._addr[1]) + "] Received " + msg.__class__.__name__ + (" from id " + str(msg.from_id) if msg.command != "join" else ""))
+
+            # Deal with message on the worker pool - updates only touch dicts, handle them inline
+            if msg.command == "update":
+                self.action(conn, msg)
+            else:
+                future = self._workers.submit(self.action, conn, msg)
+                future.add_done_callback(self.logWorkerError)  # Futures are otherwise discarded
+
+        if not closed:
+            return
 
         # Connection ended (with peer)
-        if msg == None and self.isDaemon(conn):
-            id = self.getIdByRecvConn(conn)
+        if self.isDaemon(conn):
+            id = self.getIdByConn(conn)
             print("[DEBUG PORT=" + str(self._addr[1]) + "] Peer crashed! Id " + str(id))
-            self.crashHandler(id)
-            self._recv_conn.pop(id, None)
-            self._send_conn.pop(id, None)
-            self._sel.unregister(conn)
-            conn.close()
-            return
+            if id in self._net_info:  # A replaced connection may close after the peer was handled
+                self.crashHandler(id)
+            self._conn.pop(id, None)
+            self._conn_to_id.pop(conn, None)
         # Connection ended (with client)
-        elif msg == None and not self.isDaemon(conn):
+        else:
             print("[DEBUG PORT=" + str(self._addr[1]) + "] Client disconnected!")
-            self._client_request.pop(conn, None)
-            self._sel.unregister(conn)
-            conn.close()
-            return
-
-        # Index received connection by id
-        if msg.command != "join" and msg.from_id != 0:
-            self.setRecvConn(msg.from_id, conn)
-
-        print("[DEBUG PORT=" + str(self._addr[1]) + "] Received " + msg.__class__.__name__ + (" from id " + str(msg.from_id) if msg.command != "join" else ""))
-
-        # Create thread to deal with message
-        t = Thread(target=self.action, args=[conn, msg])
-        t.start()
+            hash = self._client_request.pop(conn, None)
+            if hash != None and hash in self._client_request_by_hash:
+                conns = self._client_request_by_hash[hash]
+                if conn in conns:
+                    conns.remove(conn)
+                if not conns:
+                    del self._client_request_by_hash[hash]
+        self._send_locks.pop(conn, None)
+        self._rxbuf.pop(conn, None)
+        self._sel.unregister(conn)
+        conn.close()
+
+    def logWorkerError(self, future):
+        """Logs an exception raised by a handler on the worker pool."""
+        error = future.exception()
+        if error != None:
+            print("[FAIL PORT=" + str(self._addr[1]) + "] Handler raised an exception:")
+            traceback.print_exception(type(error), error, error.__traceback__)
 
     def action(self, conn: socket.socket, msg):
         """Takes apropriate action based on received message."""
-            
-        if msg.command == "join":
-            # Determine new peer id
-            new_id = max(self.getIds()) + 1  # Must be the highest id on the network
-
-            # Update self
-            self.setAddr(new_id, msg.addr)
-            self.setRecvConn(new_id, conn)  # Index received connection by id
-
-            # Configure new peer
-            config_msg = PeerProto.config(self._id, new_id, self.getNetInfo())
-            self._send_mutex.acquire()
-            PeerProto.send_msg(self.getSendConn(new_id), config_msg)
-            self._send_mutex.release()
-
-            # Update every peer, except new and self
-            add = {new_id: {"addr": self.getAddr(new_id)}}
-            update_msg = PeerProto.update(self._id, add=add)
-            for id in self.getIds():
-                if id != new_id and id != self._id:
-                    self._send_mutex.acquire()
-                    PeerProto.send_msg(self.getSendConn(id), update_msg)
-                    self._send_mutex.release()
-
-            # Replicate self images to new peer - only if there are just 2 peers in the network (self and new)
-            if len(self.getIds()) == 2:
-                for hash in self.getHashes(self._id):
-                    image_msg = PeerProto.image(self._id, hash, self.getImage(hash), self.getFname(hash), store=True)
-                    self._send_mutex.acquire()
-                    PeerProto.send_msg(self.getSendConn(new_id), image_msg)
-                    self._send_mutex.release()
-
-        elif msg.command == "config":
-            # Configure self
-            self._id = msg.new_id
-            self._net_info = msg.net_info
-            self.setSendConn(msg.from_id, self._join_sock)  # Now join socket can be indexed, we know its peer id
+        handler = self._handlers.get(msg.command)
+        if handler != None:
+            try:
+                handler(conn, msg)
+            except OSError:
+                # Send hit a dead connection - its close event performs the cleanup
+                print("[DEBUG PORT=" + str(self._addr[1]) + "] Send failed while handling " + msg.__class__.__name__)
+
+    def joinHandler(self, conn: socket.socket, msg):
+        """Handles a received JoinMessage."""
+        # Determine new peer id
+        new_id = max(self.getIds()) + 1  # Must be the highest id on the network
 
-            # Index images of self, as entire network is known
-            self._folder_mutex.acquire()
+        # Update self
+        self.setAddr(new_id, msg.addr)
+        self.setConn(new_id, conn)  # Index received connection by id
+
+        # Configure new peer
+        config_msg = PeerProto.config(self._id, new_id, self.getNetInfo())
+        with self.getSendLock(self.getConn(new_id)):
+            PeerProto.send_msg(self.getConn(new_id), config_msg)
+
+        # Update every peer, except new and self
+        add = {new_id: {"addr": self.getAddr(new_id)}}
+        update_msg = PeerProto.update(self._id, add=add)
+        payload = PeerProto.serialize(update_msg)  # Serialize once for every peer
+        for id in list(self.getIds()):  # Snapshot - a join mid-loop would mutate the live view
+            if id != new_id and id != self._id:
+                with self.getSendLock(self.getConn(id)):
+                    PeerProto.send_raw(self.getConn(id), payload)
+
+        # Replicate self images to new peer - only if there are just 2 peers in the network (self and new)
+        if len(self.getIds()) == 2:
+            hashes = list(self.getHashes(self._id))  # Snapshot of the live set
+            # Generator - send_msgs flushes in batches, so only one batch of images is resident
+            image_msgs = (PeerProto.image(self._id, hash, self.getImageBytes(hash), self.getFname(hash), store=True)
+                          for hash in hashes)
+            with self.getSendLock(self.getConn(new_id)):
+                PeerProto.send_msgs(self.getConn(new_id), image_msgs)
+
+    def configHandler(self, conn: socket.socket, msg):
+        """Handles a received ConfigMessage."""
+        # Configure self
+        self._id = msg.new_id
+        self.setNetInfo(msg.net_info)
+        self.setConn(msg.from_id, self._join_sock)  # Now join socket can be indexed, we know its peer id
+
+        # Index images of self, as entire network is known - snapshot the folder
+        # state under the mutex, fan out to peers without holding it
+        with self._folder_mutex:
             self.parseFolder()
-
-            # Update every peer hashes, except self
-            add = {self._id: {"hash": self.getHashes(self._id), "size": self.getSize(self._id)}}
-            update_msg = PeerProto.update(self._id, add=add)
-            for id in self.getIds():
-                if id != self._id:
-                    self._send_mutex.acquire()
-                    PeerProto.send_msg(self.getSendConn(id), update_msg)
-                    self._send_mutex.release()
-
-            # Replicate self images across the network
-            hashes = self.getHashes(self._id)
-            ids = list(self.getIds())  # Convert to list so it can be iterated
-            i = 0  # Current index on ids
-            for hash in hashes:
-                while True:
-                    i = (i + 1) % len(ids)  # Update index on circular list
-                    if ids[i] != self._id:
-                        image_msg = PeerProto.image(self._id, hash, self.getImage(hash), self.getFname(hash), store=True)
-                        self._send_mutex.acquire()
-                        PeerProto.send_msg(self.getSendConn(ids[i]), image_msg)
-                        self._send_mutex.release()
-                        break
-            self._folder_mutex.release()
-
-        elif msg.command == "update":
-            # Add information
-            for id, info in msg.add.items():
-                if "addr" in info:
-                    self.setAddr(id, info["addr"])
-                if "hash" in info:
-                    for hash in info["hash"]:
-                        self.addHash(id, hash)
-                if "size" in info:
-                    self.setSize(id, info["size"])
-            # Remove information
-            for id, info in msg.rem.items():
-                if "addr" in info:
-                    self.setAddr(id, tuple())
-                if "hash" in info:
-                    for hash in info["hash"]:
-                        self.removeHash(id, hash)
-                if "size" in info:
-                    self.setSize(id, int())
-
-            # Sender peer doesn't have a connection with self in its "_recv_conn" - needed if self crashes
-            if msg.from_id not in self._send_conn.keys():
-                # Update peer by sending an empty update message
-                update_msg = PeerProto.update(self._id)
-                self._send_mutex.acquire()
-                PeerProto.send_msg(self.getSendConn(msg.from_id), update_msg)
-                self._send_mutex.release()
-
-        elif msg.command == "request_image":
-            # Received from client
-            if msg.from_id == 0:
-                # Image is in not in self
-                if msg.hash not in self.getHashes(self._id):
-                    self._client_request[conn] = msg.hash
-                    id = self.getIdByHash(msg.hash)  # Id of a peer with hash
-                    request_image_msg = PeerProto.request_image(self._id, msg.hash)
-                    self._send_mutex.acquire()
-                    PeerProto.send_msg(self.getSendConn(id), request_image_msg)
-                    self._send_mutex.release()
-                    return  # Self needs to wait for ImageMessage to send to client
-                else:
-                    # Image is in self
-                    image_msg = PeerProto.image(self._id, msg.hash, self.getImage(msg.hash), self.getFname(msg.hash))
-                    self._send_mutex.acquire()
-                    PeerProto.send_msg(conn, image_msg)
-                    self._send_mutex.release()
+            hashes = list(self.getHashes(self._id))  # Snapshot
+            size = self.getSize(self._id)
+
+        # Update every peer hashes, except self
+        add = {self._id: {"hash": set(hashes), "size": size}}
+        update_msg = PeerProto.update(self._id, add=add)
+        payload = PeerProto.serialize(update_msg)  # Serialize once for every peer
+        for id in list(self.getIds()):  # Snapshot - a join mid-loop would mutate the live view
+            if id != self._id:
+                with self.getSendLock(self.getConn(id)):
+                    PeerProto.send_raw(self.getConn(id), payload)
+
+        # Replicate self images across the network - batch hashes per target peer
+        ids = list(self.getIds())  # Convert to list so it can be iterated
+        i = 0  # Current index on ids
+        batches = {}  # { id: [hash,..] }
+        for hash in hashes:
+            while True:
+                i = (i + 1) % len(ids)  # Update index on circular list
+                if ids[i] != self._id:
+                    batches.setdefault(ids[i], []).append(hash)
+                    break
+        for id, id_hashes in batches.items():
+            # Generator - send_msgs flushes in batches, so only one batch of images is resident
+            image_msgs = (PeerProto.image(self._id, hash, self.getImageBytes(hash), self.getFname(hash), store=True)
+                          for hash in id_hashes)
+            with self.getSendLock(self.getConn(id)):
+                PeerProto.send_msgs(self.getConn(id), image_msgs)
+        self._ready.set()  # Configured on the network
+
+    def updateHandler(self, conn: socket.socket, msg):
+        """Handles a received UpdateMessage."""
+        # Add information
+        for id, info in msg.add.items():
+            if "addr" in info:
+                self.setAddr(id, info["addr"])
+            if "hash" in info:
+                for hash in info["hash"]:
+                    self.addHash(id, hash)
+            if "size" in info:
+                self.setSize(id, info["size"])
+        # Remove information
+        for id, info in msg.rem.items():
+            if "addr" in info:
+                self.setAddr(id, tuple())
+            if "hash" in info:
+                for hash in info["hash"]:
+                    self.removeHash(id, hash)
+            if "size" in info:
+                self.setSize(id, int())
+
+    def requestImageHandler(self, conn: socket.socket, msg):
+        """Handles a received RequestImageMessage."""
+        # Received from client
+        if msg.from_id == 0:
+            # Image is in not in self
+            if msg.hash not in self.getHashes(self._id):
+                self._client_request[conn] = msg.hash
+                self._client_request_by_hash.setdefault(msg.hash, []).append(conn)
+                id = self.getIdByHash(msg.hash)  # Id of a peer with hash
+                request_image_msg = PeerProto.request_image(self._id, msg.hash)
+                with self.getSendLock(self.getConn(id)):
+                    PeerProto.send_msg(self.getConn(id), request_image_msg)
+                return  # Self needs to wait for ImageMessage to send to client
             else:
                 # Image is in self
-                image_msg = PeerProto.image(self._id, msg.hash, self.getImage(msg.hash), self.getFname(msg.hash))
-                self._send_mutex.acquire()
-                PeerProto.send_msg(self.getSendConn(msg.from_id), image_msg)
-                self._send_mutex.release()
-
-        elif msg.command == "image":
-            # Requested by client
-            for conn, hash in self._client_request.items():
-                if hash == msg.hash:
-                    image_msg = PeerProto.image(self._id, msg.hash, msg.image, msg.fname)
-                    self._send_mutex.acquire()
+                image_msg = PeerProto.image(self._id, msg.hash, self.getImageBytes(msg.hash), self.getFname(msg.hash))
+                with self.getSendLock(conn):
                     PeerProto.send_msg(conn, image_msg)
-                    self._send_mutex.release()
-
-            # Requested by self or to be stored
-            if msg.hash in self._own_request or msg.store == True:
-                self._own_request.discard(msg.hash)
-                # Configure self
-                self._folder_mutex.acquire()
-                self.addImage(msg.hash, msg.image, msg.fname)
+        else:
+            # Image is in self - stream it from disk with zero-copy
+            with self.getSendLock(self.getConn(msg.from_id)):
+                PeerProto.send_image_file(self.getConn(msg.from_id), self._id, msg.hash, self.getImagePath(msg.hash), self.getFname(msg.hash))
+
+    def imageHandler(self, conn: socket.socket, msg):
+        """Handles a received ImageMessage."""
+        # Requested by client
+        client_conns = self._client_request_by_hash.pop(msg.hash, [])
+        if client_conns:
+            image_msg = PeerProto.image(self._id, msg.hash, msg.image_bytes, msg.fname)
+            payload = PeerProto.serialize(image_msg)  # Serialize once for every waiting client
+            for client_conn in client_conns:
+                self._client_request.pop(client_conn, None)
+                with self.getSendLock(client_conn):
+                    PeerProto.send_raw(client_conn, payload)
+
+        # Requested by self or to be stored
+        if msg.hash in self._own_request or msg.store == True:
+            self._own_request.discard(msg.hash)
+            # Configure self
+            with self._folder_mutex:
+                self.addImage(msg.hash, msg.image_bytes, msg.fname)
                 self.addHash(self._id, msg.hash)
-                self._folder_mutex.release()
-
-                # Update every peer hashes, except self
-                add = {self._id: {"hash": {msg.hash}, "size": self.getSize(self._id)}}
-                update_msg = PeerProto.update(self._id, add=add)
-                for id in self.getIds():
-                    if id != self._id:
-                        self._send_mutex.acquire()
-                        PeerProto.send_msg(self.getSendConn(id), update_msg)
-                        self._send_mutex.release()
-
-        elif msg.command == "request_list":
-            list_msg = PeerProto.list(self.getNetHashes())
-            self._send_mutex.acquire()
+
+            # Update every peer hashes, except self
+            add = {self._id: {"hash": {msg.hash}, "size": self.getSize(self._id)}}
+            update_msg = PeerProto.update(self._id, add=add)
+            payload = PeerProto.serialize(update_msg)  # Serialize once for every peer
+            for id in list(self.getIds()):  # Snapshot - a join mid-loop would mutate the live view
+                if id != self._id:
+                    with self.getSendLock(self.getConn(id)):
+                        PeerProto.send_raw(self.getConn(id), payload)
+
+    def requestListHandler(self, conn: socket.socket, msg):
+        """Handles a received RequestListMessage."""
+        list_msg = PeerProto.list(self.getNetHashes())
+        with self.getSendLock(conn):
             PeerProto.send_msg(conn, list_msg)
-            self._send_mutex.release()
 
-    def setSendConn(self, id, conn: socket.socket):
-        self._send_conn[id] = conn
+    def ready(self):
+        """Blocks until self is configured on the network."""
+        self._ready.wait()
+
+    def getSendLock(self, conn: socket.socket) -> Lock:
+        return self._send_locks.setdefault(conn, Lock())  # setdefault is atomic
 
-    def getSendConn(self, id) -> socket.socket:
-        if id not in self._send_conn.keys():
+    def setConn(self, id, conn: socket.socket):
+        old_conn = self._conn.get(id)
+        if old_conn != None and old_conn != conn:
+            self._conn_to_id.pop(old_conn, None)  # Replaced connection must not map back to id
+        self._conn[id] = conn
+        self._conn_to_id[conn] = id
+
+    def getConn(self, id) -> socket.socket:
+        if id not in self._conn.keys():
             id_addr = self.getAddr(id)
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect(id_addr)
-            self._send_conn[id] = sock
-        return self._send_conn[id]
-
-    def setRecvConn(self, id, conn: socket.socket):
-        self._recv_conn[id] = conn
-
-    def getRecvConn(self, id) -> socket.socket:
-        if id not in self._recv_conn.keys():
-            return None
-        return self._recv_conn[id]
+            self.setConn(id, sock)
+            # The connection is full-duplex - peer replies arrive on it too
+            self._rxbuf[sock] = bytearray()
+            self._sel.register(sock, selectors.EVENT_READ, self.read)
+        return self._conn[id]
 
     def getIds(self) -> set:
-        return set(self._net_info.keys())
+        return self._net_info.keys()  # Set-like view, no copy
 
     def setAddr(self, id, addr):
         if id not in self.getIds():
             self._net_info[id] = {"addr": tuple(), "hash": set(), "size": int()}
+        self._addr_to_id.pop(tuple(self._net_info[id]["addr"]), None)
         self._net_info[id]["addr"] = addr
+        if addr:
+            self._addr_to_id[tuple(addr)] = id
 
     def getAddr(self, id) -> tuple:
-        return tuple(self._net_info[id]["addr"])
+        return self._net_info[id]["addr"]  # No copy, callers must not mutate
 
     def addHash(self, id, hash):
         if id not in self.getIds():
             self._net_info[id] = {"addr": tuple(), "hash": set(), "size": int()}
         self._net_info[id]["hash"].add(hash)
+        self._hash_to_id[hash] = id
+        self._all_hashes.add(hash)
 
     def removeHash(self, id, hash):
         self._net_info[id]["hash"].discard(hash)
+        if self._hash_to_id.get(hash) == id:
+            self._hash_to_id.pop(hash)
+            # Reassign to another peer still holding the hash
+            for other_id in self.getIds():
+                if hash in self._net_info[other_id]["hash"]:
+                    self._hash_to_id[hash] = other_id
+                    break
+            else:
+                self._all_hashes.discard(hash)  # No peer holds the hash anymore
 
     def getHashes(self, id) -> set:
-        return set(self._net_info[id]["hash"])
+        return self._net_info[id]["hash"]  # No copy, callers must not mutate
 
     def getNetHashes(self) -> set:
-        hashes = set()
-        for id in self.getIds():
-            hashes = hashes.union(self.getHashes(id))
-        return hashes
+        return self._all_hashes  # No copy, callers must not mutate
 
     def setSize(self, id, size):
         if id not in self.getIds():
@@ -294,51 +389,73 @@ class Daemon(Thread):
         self._net_info[id]["size"] = size
 
     def getSize(self, id) -> int:
-        return int(self._net_info[id]["size"])
+        return self._net_info[id]["size"]
 
     def getNetInfo(self) -> dict:
-        return dict(self._net_info)
+        return self._net_info  # No copy, callers must not mutate
+
+    def setNetInfo(self, net_info: dict):
+        self._net_info = net_info
+        # Rebuild reverse indexes and hash union
+        self._all_hashes = set()
+        self._hash_to_id = {}
+        self._addr_to_id = {}
+        for id, info in net_info.items():
+            if info["addr"]:
+                self._addr_to_id[tuple(info["addr"])] = id
+            for hash in info["hash"]:
+                self._hash_to_id[hash] = id
+                self._all_hashes.add(hash)
 
     def getIdByAddr(self, addr) -> int:
-        for id in self.getIds():
-            if self.getAddr(id) == addr:
-                return id
+        return self._addr_to_id.get(tuple(addr))
 
     def getIdByHash(self, hash) -> int:
-        for id in self.getIds():
-            for id_hash in self.getHashes(id):
-                if id_hash == hash:
-                    return id
+        return self._hash_to_id.get(hash)
 
-    def getIdByRecvConn(self, conn) -> int:
-        for id in self.getIds():
-            if self.getRecvConn(id) == conn:
-                return id
+    def getIdByConn(self, conn) -> int:
+        return self._conn_to_id.get(conn)
 
-    def addImage(self, hash: bytes, image: Image, fname: str):
+    def addImage(self, hash: bytes, image_bytes: bytes, fname: str):
         image_path = os.path.join(self._folder_path, fname)
-        format = "jpeg" if fname == "jpg" else None
-        image.save(image_path, format=format)
-        # Update self
+        with open(image_path, "wb") as file:
+            file.write(image_bytes)
+        # Update self - apply the size delta instead of rescanning the folder
         self._image[hash] = image_path
-        self.setSize(self._id, self.getFolderSize())
+        self.setSize(self._id, self.getSize(self._id) + os.path.getsize(image_path))
+        self._bytes_cache.pop(hash, None)  # Hash may have been cached for a previous file
 
     def removeImage(self, hash: bytes):
         image_path = self._image.pop(hash)
+        image_size = os.path.getsize(image_path)
         os.remove(image_path)
-        # Update self
-        self.setSize(self._id, self.getFolderSize())
+        # Update self - apply the size delta instead of rescanning the folder
+        self.setSize(self._id, self.getSize(self._id) - image_size)
+        self._bytes_cache.pop(hash, None)
 
     def getImage(self, hash) -> Image:
         image_path = self._image[hash]
         image = Image.open(image_path, mode="r")
         return image
 
+    def getImageBytes(self, hash) -> bytes:
+        image_bytes = self._bytes_cache.get(hash)
+        if image_bytes == None:
+            with open(self._image[hash], "rb") as file:
+                image_bytes = file.read()
+            if len(self._bytes_cache) >= 128:  # Bound the cache, dropping the oldest entry
+                self._bytes_cache.pop(next(iter(self._bytes_cache)))
+            self._bytes_cache[hash] = image_bytes
+        return image_bytes
+
+    def getImagePath(self, hash) -> str:
+        return self._image[hash]
+
     def getFname(self, hash) -> str:
         return str(self._image[hash].split("/")[-1])
 
     def isDaemon(self, conn: socket.socket) -> bool:
-        return conn in self._recv_conn.values()
+        return conn in self._conn_to_id
 
     def compareImages(self, image_path1, image_path2):
         image1 = Image.open(image_path1)
@@ -353,8 +470,12 @@ class Daemon(Thread):
         image1_size = image1_dim[0] * image1_dim[1]  # total pixels
         image2_size = image2_dim[0] * image2_dim[1]
 
-        n_image1_colours = len(image1.getcolors(image1_size))
-        n_image2_colours = len(image2.getcolors(image2_size))
+        # Count distinct colours vectorized on a 256x256 thumbnail - only a monotone
+        # proxy for colour richness is needed, so the downsample keeps the ordering
+        arr1 = cv2.resize(np.asarray(image1.convert("RGB")), (256, 256), interpolation=cv2.INTER_AREA).reshape(-1, 3)
+        arr2 = cv2.resize(np.asarray(image2.convert("RGB")), (256, 256), interpolation=cv2.INTER_AREA).reshape(-1, 3)
+        n_image1_colours = len(np.unique(arr1, axis=0))
+        n_image2_colours = len(np.unique(arr2, axis=0))
 
         if image1_size > image2_size:
             return (image_path1, image_path2)
@@ -370,39 +491,57 @@ class Daemon(Thread):
 
     def getFolderSize(self):
         size = 0
-        for image_file in os.listdir(self._folder_path):
-            if image_file.startswith("."):
+        for entry in os.scandir(self._folder_path):
+            if entry.name.startswith("."):
                 continue
-            image_path = os.path.join(self._folder_path, image_file)
-            size += os.path.getsize(image_path)
+            size += entry.stat().st_size  # Cached by scandir, no extra stat call
         return size
 
+    @staticmethod
+    def hashImage(image_path) -> tuple:
+        """Computes the average hash of a single image file."""
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        image = cv2.resize(image, (8, 8), interpolation=cv2.INTER_AREA)
+        bits = (image > image.mean()).astype(np.uint8).flatten()
+        hash = np.packbits(bits).tobytes()  # Raw 8-byte hash
+        return (hash, image_path)
+
     def parseFolder(self):
         image_tmp = {}  # { hash: path } - Assign to self._image at the end
         hashes_tmp = set()  # { h1,..,hN } - Assign to self._net_info at the end with self.addHash(...)
 
-        # Index images by hash
-        for image_file in os.listdir(self._folder_path):
-            
-            image_path = os.path.join(self._folder_path, image_file)
-            
-            if not image_file.endswith(".jpeg") and not image_file.endswith(".jpg") and not image_file.endswith(".png"):
-                os.remove(image_path)
-                print("[DEBUG PORT=" + str(self._addr[1]) + "] Removed invalid image \"" + image_file + "\"")
+        # List valid images, deleting trash along the way - single directory scan
+        image_paths = []
+        image_sizes = {}  # { path: size } - To discount removed duplicates below
+        folder_size = 0
+        for entry in os.scandir(self._folder_path):
+            if not entry.name.endswith(".jpeg") and not entry.name.endswith(".jpg") and not entry.name.endswith(".png"):
+                os.remove(entry.path)
+                print("[DEBUG PORT=" + str(self._addr[1]) + "] Removed invalid image \"" + entry.name + "\"")
                 continue # Delete trash
+            image_paths.append(entry.path)
+            image_sizes[entry.path] = entry.stat().st_size  # Cached by scandir, no extra stat call
+            folder_size += image_sizes[entry.path]
+
+        # Hash images in parallel - decode and hash dominate the folder scan
+        with ThreadPoolExecutor() as executor:
+            results = executor.map(Daemon.hashImage, image_paths)
 
-            image = Image.open(image_path, mode="r")
-            hash = str(imagehash.average_hash(image)).encode("utf-8")
+        # Index images by hash
+        for hash, image_path in results:
+            image_file = os.path.basename(image_path)
 
             if hash in image_tmp.keys():
                 similar_image_path = image_tmp[hash]
                 comparison_result = self.compareImages(similar_image_path, image_path)
                 # Delete duplicate image from folder
                 os.remove(comparison_result[1])
+                folder_size -= image_sizes[comparison_result[1]]
                 image_tmp[hash] = comparison_result[0]
                 print("[DEBUG PORT=" + str(self._addr[1]) + "] Removed duplicate image \"" + comparison_result[1] + "\"")
             elif hash in self.getNetHashes():
                 os.remove(image_path)
+                folder_size -= image_sizes[image_path]
                 print("[DEBUG PORT=" + str(self._addr[1]) + "] Removed duplicate image \"" + image_file + "\"")
             else:
                 # Index image
@@ -414,13 +553,24 @@ class Daemon(Thread):
             self._image[hash] = image_path
         for hash in hashes_tmp:
             self.addHash(self._id, hash)
-        self.setSize(self._id, self.getFolderSize())
+        self.setSize(self._id, folder_size)
 
     def crashHandler(self, id):
         """Handles crash of id."""
         # Backup and remove crashed id hash entries on net_info
         hashes_crashed = self.getHashes(id)
+        self._addr_to_id.pop(tuple(self.getAddr(id)), None)
         self._net_info.pop(id)
+        # Reassign crashed id reverse hash entries to peers still holding them
+        for hash in hashes_crashed:
+            if self._hash_to_id.get(hash) == id:
+                self._hash_to_id.pop(hash)
+                for other_id in self.getIds():
+                    if hash in self._net_info[other_id]["hash"]:
+                        self._hash_to_id[hash] = other_id
+                        break
+                else:
+                    self._all_hashes.discard(hash)  # Hash was only on the crashed peer
         # Order peer ids by least size, and by smallest id in case of tie
         ids = self.getIds()
         sizes = [self.getSize(id) for id in ids]
@@ -442,16 +592,20 @@ class Daemon(Thread):
                 # Request image from the peer storing it
                 self._own_request.add(hash)  # So self know it needs to store the image when he receives it
                 request_image_msg = PeerProto.request_image(self._id, hash)
-                self._send_mutex.acquire()
-                PeerProto.send_msg(self.getSendConn(id_hash), request_image_msg)
-                self._send_mutex.release()
+                try:
+                    with self.getSendLock(self.getConn(id_hash)):
+                        PeerProto.send_msg(self.getConn(id_hash), request_image_msg)
+                except OSError:
+                    # That peer also went down - its own crash event redistributes again
+                    print("[DEBUG PORT=" + str(self._addr[1]) + "] Peer " + str(id_hash) + " unreachable during redistribution")
             # Image is in self
             elif id_hash != None and id_hash == self._id:
-                # Send image to backup peer
-                image_msg = PeerProto.image(self._id, hash, self.getImage(hash), self.getFname(hash), store=True)
-                self._send_mutex.acquire()
-                PeerProto.send_msg(self.getSendConn(id_backup), image_msg)
-                self._send_mutex.release()
+                # Send image to backup peer - stream it from disk with zero-copy
+                try:
+                    with self.getSendLock(self.getConn(id_backup)):
+                        PeerProto.send_image_file(self.getConn(id_backup), self._id, hash, self.getImagePath(hash), self.getFname(hash), store=True)
+                except OSError:
+                    print("[DEBUG PORT=" + str(self._addr[1]) + "] Peer " + str(id_backup) + " unreachable during redistribution")
             else:
                 print("[FAIL PORT=" + str(self._addr[1]) + "] Image with hash \"" + str(hash) + "\" was lost!")
 
@@ -459,7 +613,7 @@ class Daemon(Thread):
         """Run until done."""
 
         while True:
-            events = self._sel.select()
+            events = self._sel.select(timeout=1)  # Timeout so the loop can also service pending work
             for key, mask in events:
                 callback = key.data
                 callback(key.fileobj)
@@ -1,14 +1,23 @@
-import pickle
+import io
+import msgspec
+import os
 import socket
 
 from PIL import Image
 
+# Shared msgpack encoder/decoder - built once, reused for every message
+_ENCODER = msgspec.msgpack.Encoder()
+_DECODER = msgspec.msgpack.Decoder()
+
 
 class Message:
     """Message Type."""
 
+    __slots__ = ("_command", "_cached")
+
     def __init__(self, command: str):
         self._command = command
+        self._cached = None  # Memoized encoded form - messages are immutable once built
 
     @property
     def command(self):
@@ -18,6 +27,9 @@ class Message:
 class JoinMessage(Message):
     """Message to join the network."""
 
+    _TAG = 0  # Wire tag - first element of the encoded array
+    __slots__ = ("_addr",)
+
     def __init__(self, addr: list):
         super().__init__("join")
         self._addr = addr
@@ -27,7 +39,9 @@ class JoinMessage(Message):
         return self._addr
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "addr": self._addr})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._addr))
+        return self._cached
 
 
 class ConfigMessage(Message):
@@ -40,6 +54,9 @@ class ConfigMessage(Message):
             { id: { addr: (host, port), hash: {h1,..,hN} } }
     """
 
+    _TAG = 1
+    __slots__ = ("_from_id", "_new_id", "_net_info")
+
     def __init__(self, from_id: int, new_id: int, net_info: dict):
         super().__init__("config")
         self._from_id = from_id
@@ -59,8 +76,9 @@ class ConfigMessage(Message):
         return self._net_info
 
     def __bytes__(self) -> str:
-        net_info = self._net_info
-        return pickle.dumps({"command": self._command, "from_id": self._from_id, "new_id": self._new_id, "net_info": net_info})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._from_id, self._new_id, self._net_info))
+        return self._cached
 
 
 class UpdateMessage(Message):
@@ -74,6 +92,9 @@ class UpdateMessage(Message):
             { id: { addr: (host, port), hash: {h1,..,hN}, size: value } }
     """
 
+    _TAG = 2
+    __slots__ = ("_from_id", "_add", "_rem")
+
     def __init__(self, from_id: int, add: dict, rem: dict):
         super().__init__("update")
         self._from_id = from_id
@@ -93,12 +114,17 @@ class UpdateMessage(Message):
         return self._rem
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "from_id": self._from_id, "add": self._add, "rem": self._rem})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._from_id, self._add, self._rem))
+        return self._cached
 
 
 class RequestImageMessage(Message):
     """Message to request an image from a peer."""
 
+    _TAG = 3
+    __slots__ = ("_from_id", "_hash")
+
     def __init__(self, from_id: int, hash: bytes):
         super().__init__("request_image")
         self._from_id = from_id
@@ -113,19 +139,29 @@ class RequestImageMessage(Message):
         return self._hash
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "from_id": self._from_id, "hash": self._hash})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._from_id, self._hash))
+        return self._cached
 
 
 class ImageMessage(Message):
-    """Message to send an image to a peer."""
+    """Message to send an image to a peer.
+
+    Carries the encoded image file bytes verbatim; pixels are only decoded
+    on demand through the lazy image property.
+    """
+
+    _TAG = 4
+    __slots__ = ("_from_id", "_hash", "_image_bytes", "_fname", "_store", "_decoded")
 
-    def __init__(self, from_id: int, hash: bytes, image: Image, fname: str, store: bool = False):
+    def __init__(self, from_id: int, hash: bytes, image_bytes: bytes, fname: str, store: bool = False):
         super().__init__("image")
         self._from_id = from_id
         self._hash = hash
-        self._image = image
+        self._image_bytes = image_bytes
         self._fname = fname
         self._store = store
+        self._decoded = None
 
     @property
     def from_id(self):
@@ -136,8 +172,15 @@ class ImageMessage(Message):
         return self._hash
 
     @property
-    def image(self):
-        return self._image
+    def image_bytes(self):
+        return self._image_bytes
+
+    @property
+    def image(self) -> Image:
+        """Decoded PIL image, built lazily from the encoded bytes."""
+        if self._decoded == None:
+            self._decoded = Image.open(io.BytesIO(self._image_bytes))
+        return self._decoded
 
     @property
     def fname(self):
@@ -148,12 +191,17 @@ class ImageMessage(Message):
         return self._store
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "from_id": self._from_id, "hash": self._hash, "image": self._image, "fname": self._fname, "store": self._store})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._from_id, self._hash, self._image_bytes, self._fname, self._store))
+        return self._cached
 
 
 class RequestListMessage(Message):
     """Message to request list of all hashes in distributed system."""
 
+    _TAG = 5
+    __slots__ = ("_from_id",)
+
     def __init__(self, from_id: int):
         super().__init__("request_list")
         self._from_id = from_id
@@ -163,12 +211,17 @@ class RequestListMessage(Message):
         return self._from_id
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "from_id": self._from_id})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._from_id))
+        return self._cached
 
 
 class ListMessage(Message):
     """Message to send a list of all hashes to client."""
 
+    _TAG = 6
+    __slots__ = ("_hashes",)
+
     def __init__(self, hashes: set):
         super().__init__("list")
         self._hashes = list(hashes)
@@ -178,12 +231,17 @@ class ListMessage(Message):
         return self._hashes
 
     def __bytes__(self) -> str:
-        return pickle.dumps({"command": self._command, "hashes": self._hashes})
+        if self._cached == None:
+            self._cached = _ENCODER.encode((self._TAG, self._hashes))
+        return self._cached
 
 
 class PeerProto:
     """Peer protocol for communication."""
 
+    _IOV_MAX = 1024  # Conservative bound on iovecs per sendmsg call
+    _BATCH_MAX = 100  # Messages coalesced per batch - diminishing returns beyond this
+
     @classmethod
     def join(cls, addr: tuple):
         """Creates a JoinMessage."""
@@ -195,9 +253,10 @@ class PeerProto:
         return ConfigMessage(from_id, your_id, net_info)
 
     @classmethod
-    def update(cls, from_id: int, add: dict = {}, rem: dict = {}):
+    def update(cls, from_id: int, add: dict = None, rem: dict = None):
         """Creates an UpdateMessage."""
-        return UpdateMessage(from_id, add, rem)
+        # None instead of {} defaults - a shared mutable default would leak between messages
+        return UpdateMessage(from_id, add if add != None else {}, rem if rem != None else {})
 
     @classmethod
     def request_image(cls, from_id: int, hash: bytes):
@@ -205,9 +264,9 @@ class PeerProto:
         return RequestImageMessage(from_id, hash)
 
     @classmethod
-    def image(cls, from_id: int, hash: bytes, image: Image, fname: str, store: bool = False):
+    def image(cls, from_id: int, hash: bytes, image_bytes: bytes, fname: str, store: bool = False):
         """Creates a ImageMessage."""
-        return ImageMessage(from_id, hash, image, fname, store)
+        return ImageMessage(from_id, hash, image_bytes, fname, store)
 
     @classmethod
     def request_list(cls, from_id: int):
@@ -219,55 +278,154 @@ class PeerProto:
         """Creates ListMessage."""
         return ListMessage(hashes)
 
+    @classmethod
+    def serialize(cls, msg: Message) -> bytes:
+        """Serializes a Message into its framed wire form."""
+        m: bytes = bytes(msg)
+        mlen: bytes = len(m).to_bytes(4, "big")
+        return mlen + m
+
+    @classmethod
+    def send_raw(cls, conn: socket.socket, payload: bytes) -> None:
+        """Sends an already serialized (framed) message through a connection."""
+        conn.sendall(payload)
+
     @classmethod
     def send_msg(cls, conn: socket.socket, msg: Message):
         """Sends through a connection a Message object."""
-        if conn.fileno() == -1:
-            return
         m: bytes = bytes(msg)
         mlen: bytes = len(m).to_bytes(4, "big")
-        conn.sendall(mlen + m)
+        # Scatter-gather write - no copy of the body to prepend the header
+        PeerProto.__send_buffers(conn, [mlen, m])
+
+    @classmethod
+    def send_msgs(cls, conn: socket.socket, msgs) -> None:
+        """Sends through a connection several Message objects, batching syscalls.
+
+        Consecutive messages to the same peer are coalesced into scatter-gather
+        writes of at most _BATCH_MAX messages, so bursts of small control
+        messages stop paying one syscall and one TCP segment each.
+        """
+        buffers = []
+        for msg in msgs:
+            m: bytes = bytes(msg)
+            buffers.append(len(m).to_bytes(4, "big"))
+            buffers.append(m)
+            if len(buffers) >= 2 * cls._BATCH_MAX:
+                PeerProto.__send_buffers(conn, buffers)
+                buffers = []
+        if buffers:
+            PeerProto.__send_buffers(conn, buffers)
+
+    @classmethod
+    def send_image_file(cls, conn: socket.socket, from_id: int, hash: bytes, path: str, fname: str, store: bool = False) -> None:
+        """Sends an ImageMessage whose payload is streamed from a file with sendfile.
+
+        The frame holds a small header followed by payload_len raw bytes, so the
+        image goes kernel to socket without passing through user space. The
+        connection must be blocking, as required by socket.sendfile.
+        """
+        payload_len = os.path.getsize(path)
+        m: bytes = _ENCODER.encode((ImageMessage._TAG, from_id, hash, None, fname, store, payload_len))
+        mlen: bytes = len(m).to_bytes(4, "big")
+        PeerProto.__send_buffers(conn, [mlen, m])
+        with open(path, "rb") as file:
+            conn.sendfile(file)
+
+    @classmethod
+    def __send_buffers(cls, conn: socket.socket, buffers: list) -> None:
+        """Sends a list of buffers with scatter-gather writes where available."""
+        if not hasattr(conn, "sendmsg"):
+            conn.sendall(b"".join(buffers))
+            return
+        views = [memoryview(b) for b in buffers]
+        while views:
+            sent = conn.sendmsg(views[:cls._IOV_MAX])
+            # Drop the buffers that went out whole, advance into a partial one
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if sent:
+                views[0] = views[0][sent:]
+
+    _recv_state = {}  # { conn: bytearray } - leftover bytes between recv calls
 
     @classmethod
     def recv_msg(cls, conn: socket.socket) -> Message:
-        """Receives through a connection a Message object."""
-        if conn.fileno() == -1:
-            return None
-        mlen: int = int.from_bytes(conn.recv(4), "big")
-        if mlen == 0:  # Connection was closed
-            return None
+        """Receives through a connection a Message object.
+
+        Reads in large chunks into a per-connection buffer, so a small
+        message (header and body in one TCP segment) costs a single recv
+        and surplus bytes are kept for the next call.
+        """
+        buf = cls._recv_state.setdefault(conn, bytearray())
+        while True:
+            msg, consumed = PeerProto.try_parse(buf)
+            if msg != None:
+                del buf[:consumed]
+                return msg
+            chunk = conn.recv(65536)
+            if not chunk:  # Connection was closed
+                cls._recv_state.pop(conn, None)
+                return None
+            buf += chunk
 
-        m: bytes = PeerProto.__recvall(conn, mlen)
-        msg = pickle.loads(m)
+    @classmethod
+    def try_parse(cls, buf: bytearray) -> tuple:
+        """Parses one framed Message from the start of buf.
+
+        Returns (msg, consumed) when buf holds a whole frame, (None, 0) otherwise.
+        """
+        if len(buf) < 4:
+            return (None, 0)
+        mlen: int = int.from_bytes(buf[:4], "big")
+        if len(buf) < 4 + mlen:
+            return (None, 0)
+        msg = _DECODER.decode(bytes(buf[4:4 + mlen]))
+        consumed = 4 + mlen
+        # Streamed images carry a trailing payload_len element after the header
+        payload_len = msg[6] if isinstance(msg, list) and len(msg) == 7 and msg[0] == ImageMessage._TAG else None
+        if payload_len != None:  # Zero-length payloads are still streamed frames
+            if len(buf) < consumed + payload_len:
+                return (None, 0)
+            msg[3] = bytes(buf[consumed:consumed + payload_len])
+            consumed += payload_len
+        return (PeerProto.__parse(msg), consumed)
+
+    _DISPATCH = (  # Indexed by wire tag, in _TAG order
+        lambda m: PeerProto.join(tuple(m[1])),
+        lambda m: PeerProto.config(m[1], m[2],
+                                   {id: PeerProto.__normalize_info(info) for id, info in m[3].items()}),
+        lambda m: PeerProto.update(m[1],
+                                   {id: PeerProto.__normalize_info(info) for id, info in m[2].items()},
+                                   {id: PeerProto.__normalize_info(info) for id, info in m[3].items()}),
+        lambda m: PeerProto.request_image(m[1], m[2]),
+        lambda m: PeerProto.image(m[1], m[2], m[3], m[4], m[5]),
+        lambda m: PeerProto.request_list(m[1]),
+        lambda m: PeerProto.list(m[1]),
+    )
 
-        if "command" not in msg:
+    @classmethod
+    def __parse(cls, msg: list) -> Message:
+        """Builds a Message object from a decoded tagged array."""
+        if not isinstance(msg, list) or len(msg) == 0:
             raise PeerProtoBadFormat(msg)
-
-        if msg["command"] == "join" and "addr" in msg:
-            return PeerProto.join(msg["addr"])
-        elif msg["command"] == "config" and "from_id" in msg and "new_id" in msg and "net_info" in msg:
-            return PeerProto.config(msg["from_id"], msg["new_id"], msg["net_info"])
-        elif msg["command"] == "update" and "from_id" in msg and "add" in msg and "rem" in msg:
-            return PeerProto.update(msg["from_id"], msg["add"], msg["rem"])
-        elif msg["command"] == "request_image" and "from_id" in msg and "hash" in msg:
-            return PeerProto.request_image(msg["from_id"], msg["hash"])
-        elif msg["command"] == "image" and "from_id" in msg and "hash" in msg and "image" in msg and "fname" in msg and "store" in msg:
-            return PeerProto.image(msg["from_id"], msg["hash"], msg["image"], msg["fname"], msg["store"])
-        elif msg["command"] == "request_list" and "from_id" in msg:
-            return PeerProto.request_list(msg["from_id"])
-        elif msg["command"] == "list" and "hashes" in msg:
-            return PeerProto.list(msg["hashes"])
-        else:
+        tag = msg[0]
+        if not isinstance(tag, int) or not 0 <= tag < len(cls._DISPATCH):
+            raise PeerProtoBadFormat(msg)
+        try:
+            return cls._DISPATCH[tag](msg)
+        except IndexError:
             raise PeerProtoBadFormat(msg)
 
     @classmethod
-    def __recvall(cls, conn: socket.socket, n: int) -> bytes:
-        """Receives n bytes through a connection."""
-        data = bytearray()
-        while len(data) < n:
-            pack = conn.recv(n - len(data))
-            data.extend(pack)
-        return bytes(data)  # Immutable
+    def __normalize_info(cls, info: dict) -> dict:
+        """Restores set/tuple types that msgpack decodes as arrays."""
+        if "addr" in info:
+            info["addr"] = tuple(info["addr"])
+        if "hash" in info:
+            info["hash"] = set(info["hash"])
+        return info
 
 
 class PeerProtoBadFormat(Exception):